@@ -0,0 +1 @@
+"""HKN officer requirement tracker."""
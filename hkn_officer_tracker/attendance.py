@@ -0,0 +1,373 @@
+"""Attendance scraping and caching for HKN officer requirement tracking."""
+
+import contextlib
+import datetime
+import fcntl
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import requests
+from dotenv import load_dotenv
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+OUT_PATH = Path(os.path.dirname(os.path.realpath(__file__))) / "data"
+RESPONSES = OUT_PATH / "responses.csv"
+EVENTS = OUT_PATH / "events.csv"
+ATTENDANCE = OUT_PATH / "attendance.parquet"
+VALIDATORS = OUT_PATH / "validators.json"
+REFRESH_LOCK = OUT_PATH / ".refresh.lock"
+ACTIVITIES = [
+    "HM",
+    "Cookie Run",
+    "Teaching Session",
+    "CM",
+    "GM",
+    "Inter-Committee Duty",
+    "QSM",
+]
+ATTENDANCE_COLUMNS = [f"{activity}s Attended" for activity in ACTIVITIES]
+STAT_INTERVAL = 60
+
+_SESSION = requests.Session()
+_CACHE: Optional[tuple[float, pd.DataFrame]] = None
+_LOCK = threading.Lock()
+_LAST_STAT_CHECK = 0.0
+
+
+def cache_attendance() -> None:
+    """
+    Reads the responses and events forms from Google Sheets, processes the
+    attendance file, then caches it to a file on disk.
+    """
+    responses_url = os.getenv("RESPONSES_URL")
+    events_url = os.getenv("EVENTS_URL")
+    OUT_PATH.mkdir(exist_ok=True)
+
+    logging.info("Fetching latest HKN attendance data")
+    validators = _read_validators()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        responses_fut = executor.submit(
+            _fetch_sheet, responses_url, RESPONSES, validators.get(responses_url)
+        )
+        events_fut = executor.submit(
+            _fetch_sheet, events_url, EVENTS, validators.get(events_url)
+        )
+        responses_req = responses_fut.result()
+        events_req = events_fut.result()
+
+    sheets = [(responses_url, responses_req), (events_url, events_req)]
+    if any(req.status_code != 304 for _, req in sheets) or not ATTENDANCE.exists():
+        responses_csv = (
+            RESPONSES.read_bytes()
+            if responses_req.status_code == 304
+            else responses_req.content
+        )
+        events_csv = (
+            EVENTS.read_bytes() if events_req.status_code == 304 else events_req.content
+        )
+
+        logging.info("Calculating attendance")
+        if pl is not None:
+            attendance = _count_attendance_polars(responses_csv, events_csv)
+        else:
+            attendance = _count_attendance_pandas(responses_csv, events_csv)
+
+        # Only persist the sheets once they have parsed successfully, so the
+        # copies the conditional requests rely on are always good data.
+        if responses_req.status_code == 200:
+            with _replace_atomically(RESPONSES) as tmp:
+                tmp.write_bytes(responses_csv)
+        if events_req.status_code == 200:
+            with _replace_atomically(EVENTS) as tmp:
+                tmp.write_bytes(events_csv)
+
+        logging.info('Saving attendance file as "attendance.parquet"')
+        with _replace_atomically(ATTENDANCE) as tmp:
+            attendance.to_parquet(tmp, index=True, compression="snappy")
+    else:
+        logging.info("Attendance data is unchanged")
+
+    # The validators file doubles as the refresh timestamp, so an unchanged
+    # refresh restarts the weekly TTL without touching the attendance file.
+    new_validators = {
+        url: (
+            {**validators.get(url, {}), **_get_validators(req)}
+            if req.status_code == 304
+            else _get_validators(req)
+        )
+        for url, req in sheets
+    }
+    with _replace_atomically(VALIDATORS) as tmp:
+        tmp.write_text(json.dumps(new_validators))
+
+
+@contextlib.contextmanager
+def _replace_atomically(path: Path) -> Iterator[Path]:
+    """
+    Yields a temporary path next to ``path`` that is moved over it once the
+    block succeeds, so readers in other processes never see a partial file.
+    """
+    fd, tmp = tempfile.mkstemp(dir=OUT_PATH, prefix=f".{path.name}.")
+    os.close(fd)
+    try:
+        yield Path(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+@contextlib.contextmanager
+def _refresh_lock() -> Iterator[None]:
+    """
+    Holds an exclusive lock shared by every worker process, so only one of
+    them refreshes the attendance at a time.
+    """
+    OUT_PATH.mkdir(exist_ok=True)
+    with open(REFRESH_LOCK, "a", encoding="utf-8") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def _is_stale() -> bool:
+    """
+    Returns whether the attendance file is missing or was last refreshed over
+    a week ago.
+    """
+    one_week = datetime.timedelta(weeks=1)
+    return (
+        not ATTENDANCE.exists()
+        or not VALIDATORS.exists()
+        or time.time() - os.path.getmtime(VALIDATORS) > one_week.total_seconds()
+    )
+
+
+def _read_validators() -> dict:
+    """
+    Reads the cached ETag/Last-Modified headers of each sheet URL.
+    """
+    try:
+        return json.loads(VALIDATORS.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _get_validators(response: requests.Response) -> dict:
+    """
+    Extracts the cache validator headers from a sheet response.
+    """
+    return {
+        header: response.headers[header]
+        for header in ("ETag", "Last-Modified")
+        if header in response.headers
+    }
+
+
+def _fetch_sheet(
+    url: str, path: Path, validators: Optional[dict]
+) -> requests.Response:
+    """
+    Fetches a sheet, making the request conditional on the validators from
+    the last fetch when a local copy of the sheet is still on disk. Raises
+    for anything other than fresh data or a 304.
+    """
+    headers = {}
+    if validators and path.exists():
+        if "ETag" in validators:
+            headers["If-None-Match"] = validators["ETag"]
+        if "Last-Modified" in validators:
+            headers["If-Modified-Since"] = validators["Last-Modified"]
+    response = _SESSION.get(url, headers=headers, timeout=10)
+    response.raise_for_status()
+    if response.status_code not in (200, 304):
+        raise requests.HTTPError(
+            f"Unexpected status {response.status_code} for {url}", response=response
+        )
+    return response
+
+
+def _normalize(column: pd.Series) -> pd.Series:
+    """
+    Strips and lowercases an Arrow-backed string column with the
+    pyarrow.compute trim and lower kernels, one after the other.
+    """
+    normalized = pc.utf8_lower(pc.utf8_trim_whitespace(pa.array(column.array)))
+    return pd.Series(
+        pd.arrays.ArrowStringArray(normalized), index=column.index, name=column.name
+    )
+
+
+def _count_attendance_pandas(responses_csv: bytes, events_csv: bytes) -> pd.DataFrame:
+    """
+    Counts each officer's valid attendance per activity with pandas. Only
+    blank cells are read as missing, matching the Polars implementation.
+    """
+    responses = pd.read_csv(
+        io.BytesIO(responses_csv),
+        usecols=["HKN Handle", "Week", "Secret Word", "Activity Type"],
+        dtype={
+            "HKN Handle": "string[pyarrow]",
+            "Week": "category",
+            "Secret Word": "string[pyarrow]",
+            "Activity Type": "category",
+        },
+        engine="c",
+        dtype_backend="pyarrow",
+        keep_default_na=False,
+        na_values=[""],
+    )
+    events = pd.read_csv(
+        io.BytesIO(events_csv),
+        usecols=["Week", "Secret Word", "Activity Type"],
+        dtype={
+            "Week": "category",
+            "Secret Word": "string[pyarrow]",
+            "Activity Type": "category",
+        },
+        engine="c",
+        dtype_backend="pyarrow",
+        keep_default_na=False,
+        na_values=[""],
+    )
+
+    responses["HKN Handle"] = _normalize(responses["HKN Handle"])
+    responses["Secret Word"] = _normalize(responses["Secret Word"])
+    events["Secret Word"] = _normalize(events["Secret Word"])
+    responses["Secret Word"] = responses["Secret Word"].astype("category")
+    events["Secret Word"] = events["Secret Word"].astype("category")
+
+    # Join on a single 64-bit hash of (Week, Secret Word) rather than on the
+    # two string columns themselves.
+    responses["Event Key"] = pd.util.hash_pandas_object(
+        responses[["Week", "Secret Word"]], index=False
+    )
+    events["Event Key"] = pd.util.hash_pandas_object(
+        events[["Week", "Secret Word"]], index=False
+    )
+    valid_attendance = pd.merge(
+        responses[["HKN Handle", "Activity Type", "Event Key"]],
+        events[["Activity Type", "Event Key"]],
+        on=["Activity Type", "Event Key"],
+        how="inner",
+    )
+    valid_attendance = valid_attendance[
+        valid_attendance["Activity Type"].isin(ACTIVITIES)
+    ]
+
+    return (
+        valid_attendance.groupby(["HKN Handle", "Activity Type"], observed=True)
+        .size()
+        .unstack("Activity Type", fill_value=0)
+        .reindex(columns=ACTIVITIES, fill_value=0)
+        .set_axis(ATTENDANCE_COLUMNS, axis="columns")
+        .sort_index()
+    )
+
+
+def _count_attendance_polars(responses_csv: bytes, events_csv: bytes) -> pd.DataFrame:
+    """
+    Counts each officer's valid attendance per activity with a Polars lazy
+    query. Produces the same frame as the pandas implementation, including
+    matching blank join keys to each other as pandas does.
+    """
+    responses = pl.scan_csv(responses_csv, infer_schema=False).select(
+        "HKN Handle", "Week", "Secret Word", "Activity Type"
+    )
+    events = pl.scan_csv(events_csv, infer_schema=False).select(
+        "Week", "Secret Word", "Activity Type"
+    )
+
+    attendance = (
+        responses.with_columns(
+            pl.col("HKN Handle").str.strip_chars().str.to_lowercase(),
+            pl.col("Secret Word").str.strip_chars().str.to_lowercase(),
+        )
+        .join(
+            events.with_columns(
+                pl.col("Secret Word").str.strip_chars().str.to_lowercase()
+            ),
+            on=["Week", "Secret Word", "Activity Type"],
+            how="inner",
+            nulls_equal=True,
+        )
+        .filter(
+            pl.col("HKN Handle").is_not_null()
+            & pl.col("Activity Type").is_in(ACTIVITIES)
+        )
+        .group_by("HKN Handle")
+        .agg(
+            [
+                (pl.col("Activity Type") == activity)
+                .sum()
+                .cast(pl.Int64)
+                .alias(f"{activity}s Attended")
+                for activity in ACTIVITIES
+            ]
+        )
+        .sort("HKN Handle")
+        .collect()
+    )
+    return attendance.to_pandas().set_index("HKN Handle")
+
+
+def fetch_attendance() -> pd.DataFrame:
+    """
+    Fetches the attendance from the in-memory cache, re-reading the file on
+    disk whenever it changes and refreshing it once it is a week old. The
+    file is only checked once every STAT_INTERVAL seconds. If a refresh
+    fails, the last good attendance is served until the next check.
+    """
+    global _CACHE, _LAST_STAT_CHECK  # pylint: disable=global-statement
+    with _LOCK:
+        now = time.monotonic()
+        if _CACHE is not None and now - _LAST_STAT_CHECK < STAT_INTERVAL:
+            return _CACHE[1]
+        _LAST_STAT_CHECK = now
+        if _is_stale():
+            try:
+                with _refresh_lock():
+                    # Another worker may have refreshed while we waited.
+                    if _is_stale():
+                        cache_attendance()
+            except Exception:  # pylint: disable=broad-exception-caught
+                logging.exception("Failed to refresh attendance")
+                if _CACHE is not None:
+                    return _CACHE[1]
+                if not ATTENDANCE.exists():
+                    raise
+        mtime = os.path.getmtime(ATTENDANCE)
+        if _CACHE is None or _CACHE[0] != mtime:
+            _CACHE = (
+                mtime,
+                pd.read_parquet(ATTENDANCE, columns=ATTENDANCE_COLUMNS),
+            )
+        return _CACHE[1]
+
+
+def main() -> None:
+    """
+    Refreshes the attendance cache from the command line.
+    """
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    with _refresh_lock():
+        cache_attendance()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Tests for the attendance counting pipelines."""
+
+import json
+import os
+
+import pandas as pd
+import pytest
+import requests
+
+from hkn_officer_tracker import attendance
+
+# Covers a handle with stray whitespace and capitals, a wrong secret word,
+# an activity type outside ACTIVITIES, a blank secret word on both sides and
+# NA-like strings ("nan", "NA"), which must be read as text rather than null.
+RESPONSES_CSV = b"""\
+Timestamp,HKN Handle,Week,Activity Type,Secret Word
+t1,alice,1,HM,apple
+t2, Alice ,2,HM, Banana
+t3,alice,1,Cookie Run,COOKIE
+t4,bob,1,HM,wrong
+t5,bob,1,CM,cherry
+t6,carol,1,Social,party
+t7,erin,3,HM,
+t8,nan,4,HM,x
+t9,bob,4,HM,Nan
+t10,carl,4,HM,NA
+"""
+
+EVENTS_CSV = b"""\
+Date,Week,Activity Type,Secret Word
+d1,1,HM,Apple
+d2,2,HM,banana
+d3,1,Cookie Run,cookie
+d4,1,CM,cherry
+d5,1,Social,party
+d6,3,HM,
+d7,4,HM,x
+d8,4,HM,nan
+d9,4,HM,na
+"""
+
+# Counts produced by the original per-activity count_attendance pipeline,
+# except that NA-like strings are compared as ordinary secret words/handles.
+EXPECTED = pd.DataFrame(
+    [
+        [2, 1, 0, 0, 0, 0, 0],
+        [1, 0, 0, 1, 0, 0, 0],
+        [1, 0, 0, 0, 0, 0, 0],
+        [1, 0, 0, 0, 0, 0, 0],
+        [1, 0, 0, 0, 0, 0, 0],
+    ],
+    index=pd.Index(["alice", "bob", "carl", "erin", "nan"], name="HKN Handle"),
+    columns=attendance.ATTENDANCE_COLUMNS,
+)
+
+
+def test_count_attendance_pandas():
+    counts = attendance._count_attendance_pandas(RESPONSES_CSV, EVENTS_CSV)
+    pd.testing.assert_frame_equal(counts, EXPECTED, check_index_type=False)
+
+
+def test_count_attendance_polars():
+    if attendance.pl is None:
+        pytest.skip("polars is not installed")
+    counts = attendance._count_attendance_polars(RESPONSES_CSV, EVENTS_CSV)
+    pd.testing.assert_frame_equal(counts, EXPECTED, check_index_type=False)
+
+
+RESPONSES_URL = "https://sheets.test/responses"
+EVENTS_URL = "https://sheets.test/events"
+LAST_MODIFIED = "Mon, 01 Jan 2024 00:00:00 GMT"
+
+
+class StubSession:
+    """
+    Serves canned sheet responses by URL and records the request headers.
+    """
+
+    def __init__(self):
+        self.replies = {}
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None):  # pylint: disable=unused-argument
+        self.requests.append((url, dict(headers or {})))
+        status, body, response_headers = self.replies[url]
+        response = requests.Response()
+        response.status_code = status
+        response._content = body  # pylint: disable=protected-access
+        response.headers.update(response_headers)
+        response.url = url
+        return response
+
+    def serve_fresh(self):
+        self.replies = {
+            RESPONSES_URL: (
+                200,
+                RESPONSES_CSV,
+                {"ETag": '"r1"', "Last-Modified": LAST_MODIFIED},
+            ),
+            EVENTS_URL: (
+                200,
+                EVENTS_CSV,
+                {"ETag": '"e1"', "Last-Modified": LAST_MODIFIED},
+            ),
+        }
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    data = tmp_path / "data"
+    monkeypatch.setattr(attendance, "OUT_PATH", data)
+    for name in ["RESPONSES", "EVENTS", "ATTENDANCE", "VALIDATORS", "REFRESH_LOCK"]:
+        monkeypatch.setattr(attendance, name, data / getattr(attendance, name).name)
+    monkeypatch.setenv("RESPONSES_URL", RESPONSES_URL)
+    monkeypatch.setenv("EVENTS_URL", EVENTS_URL)
+    stub = StubSession()
+    monkeypatch.setattr(attendance, "_SESSION", stub)
+    stub.serve_fresh()
+    return stub
+
+
+def snapshot():
+    return {
+        path: path.read_bytes()
+        for path in [
+            attendance.RESPONSES,
+            attendance.EVENTS,
+            attendance.ATTENDANCE,
+            attendance.VALIDATORS,
+        ]
+    }
+
+
+def test_cache_attendance_fresh(session):
+    attendance.cache_attendance()
+
+    assert attendance.RESPONSES.read_bytes() == RESPONSES_CSV
+    assert attendance.EVENTS.read_bytes() == EVENTS_CSV
+    pd.testing.assert_frame_equal(
+        pd.read_parquet(attendance.ATTENDANCE), EXPECTED, check_index_type=False
+    )
+    assert json.loads(attendance.VALIDATORS.read_text()) == {
+        RESPONSES_URL: {"ETag": '"r1"', "Last-Modified": LAST_MODIFIED},
+        EVENTS_URL: {"ETag": '"e1"', "Last-Modified": LAST_MODIFIED},
+    }
+    assert all(not headers for _, headers in session.requests)
+
+
+def test_cache_attendance_unchanged(session):
+    attendance.cache_attendance()
+    validators = json.loads(attendance.VALIDATORS.read_text())
+    parquet_mtime = attendance.ATTENDANCE.stat().st_mtime_ns
+    os.utime(attendance.VALIDATORS, (0, 0))
+
+    # The 304s only echo the ETag; the saved Last-Modified must survive.
+    session.replies = {
+        RESPONSES_URL: (304, b"", {"ETag": '"r1"'}),
+        EVENTS_URL: (304, b"", {"ETag": '"e1"'}),
+    }
+    session.requests.clear()
+    attendance.cache_attendance()
+
+    assert attendance.ATTENDANCE.stat().st_mtime_ns == parquet_mtime
+    assert attendance.VALIDATORS.stat().st_mtime > 0
+    assert json.loads(attendance.VALIDATORS.read_text()) == validators
+    assert not attendance._is_stale()
+    assert dict(session.requests)[RESPONSES_URL] == {
+        "If-None-Match": '"r1"',
+        "If-Modified-Since": LAST_MODIFIED,
+    }
+
+
+def test_cache_attendance_one_sheet_unchanged(session):
+    attendance.cache_attendance()
+
+    # Drop alice's week 1 HM event so the recount is visible.
+    events_csv = EVENTS_CSV.replace(b"d1,1,HM,Apple\n", b"")
+    session.replies[RESPONSES_URL] = (304, b"", {"ETag": '"r1"'})
+    session.replies[EVENTS_URL] = (200, events_csv, {"ETag": '"e2"'})
+    attendance.cache_attendance()
+
+    assert attendance.RESPONSES.read_bytes() == RESPONSES_CSV
+    assert attendance.EVENTS.read_bytes() == events_csv
+    counts = pd.read_parquet(attendance.ATTENDANCE)
+    assert counts.loc["alice", "HMs Attended"] == 1
+    assert json.loads(attendance.VALIDATORS.read_text()) == {
+        RESPONSES_URL: {"ETag": '"r1"', "Last-Modified": LAST_MODIFIED},
+        EVENTS_URL: {"ETag": '"e2"'},
+    }
+
+
+@pytest.mark.parametrize(
+    "status, body",
+    [
+        # A 5xx is rejected even when its body would parse as a sheet.
+        (503, RESPONSES_CSV + b"t11,dave,1,HM,apple\n"),
+        (200, b"<html><body>Sign in</body></html>"),
+    ],
+)
+def test_cache_attendance_bad_response(session, status, body):
+    attendance.cache_attendance()
+    before = snapshot()
+
+    session.replies[RESPONSES_URL] = (status, body, {"ETag": '"r2"'})
+    with pytest.raises(Exception):
+        attendance.cache_attendance()
+
+    assert snapshot() == before